@@ -18,6 +18,9 @@ class Settings(BaseSettings):
     # PDF解析API地址
     PDF_PARSE_API_URL: str = "http://127.0.0.1:8191"
     
+    # 是否保存各处理步骤的调试文件（debug_outputs），生产环境默认关闭
+    DEBUG_ENABLED: bool = False
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -2,8 +2,13 @@ import uvicorn
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from paddlenlp import Taskflow
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
 import re
+import string
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from operator import itemgetter
 
 '''
 
@@ -42,167 +47,248 @@ class MaskRequest(BaseModel):
 # - get_taskflow_entities
 # - apply_masking
 
+# 数字类实体正则（模块加载时编译一次，避免每次请求重复编译）
+_PROVINCES = r'[京津沪渝冀豫云辽黑湘皖鲁新苏浙赣鄂桂甘晋蒙陕吉闽贵粤青藏川宁琼]'
+
+_PATTERNS: Dict[str, str] = {
+    "身份证号": r'(?<![0-9A-Za-z])[1-9]\d{5}(?:19|20)\d{2}(?:0[1-9]|1[0-2])(?:0[1-9]|[12]\d|3[01])\d{3}[0-9Xx](?![0-9A-Za-z])',
+    "统一社会信用代码": r'(?<![0-9A-Z])[1-9ANY][1-59]\d{6}[0-9ABCDEFGHJKLMNPQRSTUWXY]{10}(?![0-9A-Z])',
+    "手机号码": r'(?<![0-9A-Za-z])(?:\+86|86)?\s?1[3-9]\d{9}(?![0-9A-Za-z])',
+    "固定电话": r'(?<![0-9A-Za-z])(?:0\d{2,3}-)?\d{7,8}(?![0-9A-Za-z])',
+    # 13-19位数字，分隔符只能出现在数字之间，避免对结尾分隔符的回溯
+    "银行卡号": r'(?<![0-9A-Za-z])\d(?:[ -]?\d){12,18}(?![0-9A-Za-z])',
+    # 常见中国护照：D/E/G/S/P开头 + 7或8位数字
+    "护照号码": r'(?<![0-9A-Z])[DEGSP]\d{7,8}(?![0-9A-Z])',
+    # 港澳通行证：C/W/H/M开头 + 8位数字
+    "港澳通行证": r'(?<![0-9A-Z])[CWHM]\d{8}(?![0-9A-Z])',
+    # 车牌只匹配ASCII空白，用局部 (?a:...) 标志代替 re.ASCII
+    "车牌号码": (
+        r'(?a:'
+        r'(?<![A-Z0-9])'
+        r'(?:'
+            # 1. 普通蓝牌/黄牌及新能源车牌 (5-6位字母数字)
+            rf'{_PROVINCES}[A-Z][\s\-]?[A-Z0-9]{{5,6}}|'
+            # 2. 港澳入出境车牌：粤Z + 4位字母数字 + 港/澳
+            r'粤Z[\s\-]?[A-Z0-9]{4}[港澳]'
+        r')'
+        r'(?![A-Z0-9])'
+        r')'
+    ),
+}
+
+# 匹配优先级：同一位置按此顺序尝试
+# （银行卡号以数字开头，不会与其后以字母/汉字开头的三类在同一位置竞争）
+_PRIORITY = ("身份证号", "统一社会信用代码", "手机号码", "固定电话", "银行卡号", "护照号码", "港澳通行证", "车牌号码")
+
+# 命名分组 <-> 标签
+_LABEL_BY_GROUP = {f"g{i}": label for i, label in enumerate(_PRIORITY)}
+_GROUP_BY_LABEL = {label: group for group, label in _LABEL_BY_GROUP.items()}
+
+@lru_cache(maxsize=None)
+def _fused_pattern(labels: tuple) -> re.Pattern:
+    """把所选类型的正则按优先级合并为一个命名分组交替式，文本只需扫描一遍"""
+    return re.compile("|".join(f"(?P<{_GROUP_BY_LABEL[l]}>{_PATTERNS[l]})" for l in labels))
+
 def get_regex_entities(text: str, labels: List[str]):
-    # ……从原文件复制完整实现……
     """使用正则匹配数字类实体"""
+    labels_set = set(labels)
+    selected = tuple(l for l in _PRIORITY if l in labels_set)
+    if not selected:
+        return []
+
+    # 合并后的正则从左到右扫描，结果互不重叠；同一位置取 _PRIORITY 中第一个匹配成功的类型
     entities = []
-    occupied_spans = set() # 记录已被高优先级实体占据的区间
-    
-    # 1. 身份证号 (最高优先级)
-    if "身份证号" in labels:
-        pat = re.compile(r'(?<![0-9A-Za-z])[1-9]\d{5}(?:19|20)\d{2}(?:0[1-9]|1[0-2])(?:0[1-9]|[12]\d|3[01])\d{3}[0-9Xx](?![0-9A-Za-z])')
-        for m in pat.finditer(text):
-            entities.append({"label": "身份证号", "start": m.start(), "end": m.end(), "text": m.group(), "method": "regex"})
-            occupied_spans.add((m.start(), m.end()))
-
-    # 2. 统一社会信用代码 (18位，次高优先级)
-    if "统一社会信用代码" in labels:
-        pat = re.compile(r'(?<![0-9A-Z])[1-9ANY][1-59]\d{6}[0-9ABCDEFGHJKLMNPQRSTUWXY]{10}(?![0-9A-Z])')
-        for m in pat.finditer(text):
-            span = (m.start(), m.end())
-            if any(s <= m.start() and m.end() <= e for s, e in occupied_spans):
-                continue
-            entities.append({"label": "统一社会信用代码", "start": m.start(), "end": m.end(), "text": m.group(), "method": "regex"})
-            occupied_spans.add(span)
-
-    # 3. 手机号码
-    if "手机号码" in labels:
-        pat = re.compile(r'(?<![0-9A-Za-z])(?:\+86|86)?\s?1[3-9]\d{9}(?![0-9A-Za-z])')
-        for m in pat.finditer(text):
-            if any(s <= m.start() and m.end() <= e for s, e in occupied_spans):
-                continue
-            entities.append({"label": "手机号码", "start": m.start(), "end": m.end(), "text": m.group(), "method": "regex"})
-            occupied_spans.add((m.start(), m.end()))
-
-    # 4. 固定电话
-    if "固定电话" in labels:
-        pat = re.compile(r'(?<![0-9A-Za-z])(?:0\d{2,3}-)?\d{7,8}(?![0-9A-Za-z])')
-        for m in pat.finditer(text):
-            if any(s <= m.start() and m.end() <= e for s, e in occupied_spans):
-                continue
-            entities.append({"label": "固定电话", "start": m.start(), "end": m.end(), "text": m.group(), "method": "regex"})
-            occupied_spans.add((m.start(), m.end()))
-
-    # 5. 银行卡号 (最低优先级，因为位宽最广 13-19位)
-    if "银行卡号" in labels:
-        pat = re.compile(r'(?<![0-9A-Za-z])((?:\d[ -]?){13,19})(?![0-9A-Za-z])')
-        for m in pat.finditer(text):
-            val = m.group()
-            dc = sum(1 for c in val if c.isdigit())
-            if 13 <= dc <= 19:
-                if any(s <= m.start() and m.end() <= e for s, e in occupied_spans):
-                    continue
-                entities.append({"label": "银行卡号", "start": m.start(), "end": m.end(), "text": val, "method": "regex"})
-                occupied_spans.add((m.start(), m.end()))
-
-    # 5. 护照号码
-    if "护照号码" in labels:
-        # 常见中国护照：D/E/G/S/P开头 + 7或8位数字
-        pat = re.compile(r'(?<![0-9A-Z])[DEGSP]\d{7,8}(?![0-9A-Z])')
-        for m in pat.finditer(text):
-            entities.append({"label": "护照号码", "start": m.start(), "end": m.end(), "text": m.group(), "method": "regex"})
-
-    # 6. 港澳通行证
-    if "港澳通行证" in labels:
-        # C/W/H/M开头 + 8位数字
-        pat = re.compile(r'(?<![0-9A-Z])[CWHM]\d{8}(?![0-9A-Z])')
-        for m in pat.finditer(text):
-            entities.append({"label": "港澳通行证", "start": m.start(), "end": m.end(), "text": m.group(), "method": "regex"})
-
-    # 7. 车牌号码
-    if "车牌号码" in labels:
-        # 所有省级简称
-        provinces = r'[京津沪渝冀豫云辽黑湘皖鲁新苏浙赣鄂桂甘晋蒙陕吉闽贵粤青藏川宁琼]'
-        
-        # 构建完整正则
-        pat = re.compile(
-            r'(?<![A-Z0-9])'
-            r'(?:'
-                # 1. 普通蓝牌/黄牌及新能源车牌 (5-6位字母数字)
-                rf'{provinces}[A-Z][\s\-]?[A-Z0-9]{{5,6}}|'
-                # 2. 港澳入出境车牌：粤Z + 4位字母数字 + 港/澳
-                r'粤Z[\s\-]?[A-Z0-9]{4}[港澳]'
-            r')'
-            r'(?![A-Z0-9])',
-            re.ASCII
-        )
-        for m in pat.finditer(text):
-            entities.append({"label": "车牌号码", "start": m.start(), "end": m.end(), "text": m.group(), "method": "regex"})
-                
+    for m in _fused_pattern(selected).finditer(text):
+        label = _LABEL_BY_GROUP[m.lastgroup]
+        entities.append({"label": label, "start": m.start(), "end": m.end(), "text": m.group(), "method": "regex"})
+
     return entities
 
+# 长文本分段使用的句子结束标志
+_CHUNK_DELIMITER = re.compile(r'[\n。！？；]')
+
+# Taskflow 模型：首次使用时加载，之后在进程内复用
+_IE_MODEL = None
+_IE_MODEL_LOCK = threading.Lock()
+# set_schema 会修改共享模型的状态，设置 schema 与推理必须串行执行
+_IE_INFER_LOCK = threading.Lock()
+
+def _get_ie_model():
+    """获取全局 Taskflow 模型（线程安全的懒加载）"""
+    global _IE_MODEL
+    if _IE_MODEL is None:
+        with _IE_MODEL_LOCK:
+            if _IE_MODEL is None:
+                _IE_MODEL = Taskflow("information_extraction", schema=OPTIONAL_SEMANTIC_SCHEMA, task_path='./model')
+    return _IE_MODEL
+
 def get_taskflow_entities(text: str, labels: List[str], max_chunk_len: int = 300):
-    """使用 Taskflow 匹配中文/语义实体（增加长文本分段处理逻辑）"""
+    """使用 Taskflow 匹配中文/语义实体（增加长文本分段处理逻辑），推理出错时返回 None"""
     if not labels:
         return []
-    ie_model = Taskflow("information_extraction", schema=OPTIONAL_SEMANTIC_SCHEMA, task_path='./model')    
+    ie_model = _get_ie_model()
     # 设定单段最大长度
     MAX_CHUNK_LEN = max_chunk_len
     
     # 1. 智能分段逻辑：优先按换行、句号等分句，避免截断实体
     def split_into_chunks(text, max_len):
         chunks = []
-        start = 0
-        # 匹配句子结束标志
-        delimiters = r'(\n|。|！|？|；)'
-        parts = re.split(delimiters, text)
-        
-        current_chunk = ""
-        current_start = 0
-        
-        for i in range(0, len(parts)-1, 2):
-            content = parts[i] + parts[i+1] # 文本 + 分隔符
-            if len(current_chunk) + len(content) > max_len and current_chunk:
-                chunks.append((current_chunk, current_start))
-                current_chunk = content
-                current_start = text.find(content, current_start + len(chunks[-1][0]))
-            else:
-                if not current_chunk:
-                    current_start = text.find(content, current_start)
-                current_chunk += content
-        
+        chunk_start = 0  # 当前分段在原文中的起点
+        pos = 0          # 当前分段已累积到的位置（不含）
+
+        # 每个分隔符结束处即一个句子（文本 + 分隔符）的结束位置
+        for m in _CHUNK_DELIMITER.finditer(text):
+            end = m.end()
+            if end - chunk_start > max_len and pos > chunk_start:
+                chunks.append((text[chunk_start:pos], chunk_start))
+                chunk_start = pos
+            pos = end
+
         # 剩余部分
-        last_part = parts[-1]
-        if len(current_chunk) + len(last_part) > max_len and current_chunk:
-            chunks.append((current_chunk, current_start))
-            chunks.append((last_part, text.find(last_part, current_start + len(chunks[-1][0]))))
-        else:
-            current_chunk += last_part
-            if current_chunk:
-                chunks.append((current_chunk, current_start))
-        
+        if len(text) - chunk_start > max_len and pos > chunk_start:
+            chunks.append((text[chunk_start:pos], chunk_start))
+            chunks.append((text[pos:], pos))
+        elif len(text) > chunk_start:
+            chunks.append((text[chunk_start:], chunk_start))
+
         return chunks
 
     all_taskflow_entities = []
     chunks = split_into_chunks(text, MAX_CHUNK_LEN)
-    
+
+    # 2. 相邻分段重叠：每段向前多取 overlap 个字符，跨分段边界的实体（如被换行拆开的地址）
+    #    能在后一段中完整识别；完全落在重叠前缀内的实体已由前一段识别，直接丢弃
+    overlap = MAX_CHUNK_LEN // 4
+    windows = []  # (送入模型的文本, 在原文中的偏移, 重叠前缀长度)
+    for chunk_text, chunk_offset in chunks:
+        if not chunk_text.strip():
+            continue
+        window_start = max(0, chunk_offset - overlap)
+        windows.append((text[window_start:chunk_offset + len(chunk_text)], window_start, chunk_offset - window_start))
+
     try:
-        ie_model.set_schema(labels)
-        for chunk_text, chunk_offset in chunks:
-            if not chunk_text.strip():
-                continue
-            
-            results = ie_model(chunk_text)
-            res = results[0] if results else {}
-            
+        # 一次性把所有分段交给模型，由 Taskflow 内部组 batch 推理
+        if not windows:
+            return []
+        with _IE_INFER_LOCK:
+            ie_model.set_schema(labels)
+            results = ie_model([w for w, _, _ in windows])
+
+        seen = set()
+        for (_, window_offset, prefix_len), res in zip(windows, results):
             for label, items in res.items():
                 for item in items:
+                    if item['end'] <= prefix_len:
+                        continue
+                    start = item['start'] + window_offset # 加上偏移量
+                    end = item['end'] + window_offset     # 加上偏移量
+                    if (start, end, label) in seen:
+                        continue
+                    seen.add((start, end, label))
                     all_taskflow_entities.append({
                         "label": label,
-                        "start": item['start'] + chunk_offset, # 加上偏移量
-                        "end": item['end'] + chunk_offset,     # 加上偏移量
+                        "start": start,
+                        "end": end,
                         "text": item['text'],
                         "method": "taskflow_chunk"
                     })
         return all_taskflow_entities
     except Exception as e:
         print(f"Taskflow error: {e}")
-        return []
+        return None
+
+# ASCII 字母数字 -> '*'
+_ALNUM_MASK_TABLE = str.maketrans({c: '*' for c in string.digits + string.ascii_letters})
+
+def _mask_positions(segment: str, positions) -> str:
+    """把段内指定位置替换为 '*'"""
+    chars = list(segment)
+    for i in positions:
+        chars[i] = '*'
+    return "".join(chars)
+
+def _mask_idcard(segment: str) -> str:
+    # 隐藏后六位
+    digits = [i for i, c in enumerate(segment) if c.isdigit() or c in 'xX']
+    return _mask_positions(segment, digits[-6:])
+
+def _mask_mobile(segment: str) -> str:
+    # 手机号隐藏第4到第7位
+    digits = [i for i, c in enumerate(segment) if c.isdigit()]
+    if len(digits) < 11:
+        return segment
+    # 针对11位及以上（含86）隐藏倒数第8到第5位，或简单处理
+    # 这里简单处理：隐藏中间4位
+    start_idx = 3 if len(digits) == 11 else len(digits) - 8
+    return _mask_positions(segment, digits[start_idx : start_idx + 4])
+
+def _mask_landline(segment: str) -> str:
+    # 固定电话中间部分掩码
+    digits = [i for i, c in enumerate(segment) if c.isdigit()]
+    mid = len(digits) // 2
+    return _mask_positions(segment, digits[max(0, mid-2):mid+2])
+
+def _mask_name(segment: str) -> str:
+    # 隐藏第一个字
+    return '*' + segment[1:] if segment else segment
+
+def _mask_keep_last4(segment: str) -> str:
+    # 保留末尾4位
+    if not segment.isascii():
+        digits = [i for i, c in enumerate(segment) if c.isdigit() or c.isalpha()]
+        return _mask_positions(segment, digits[:-4] if len(digits) > 4 else digits)
+    # ASCII 快速路径：从右往左找到保留部分的起点，前缀用 str.translate 一次性掩码
+    keep_from = len(segment)
+    kept = 0
+    for i in range(len(segment) - 1, -1, -1):
+        if segment[i].isalnum():
+            kept += 1
+            if kept == 4:
+                keep_from = i
+                break
+    prefix = segment[:keep_from]
+    if prefix.translate(_ALNUM_MASK_TABLE) == prefix:
+        # 不足5位字母数字时全部掩码
+        return segment.translate(_ALNUM_MASK_TABLE)
+    return prefix.translate(_ALNUM_MASK_TABLE) + segment[keep_from:]
+
+def _mask_passport(segment: str) -> str:
+    # 护照：保留首尾，中间掩码
+    if len(segment) <= 2:
+        return segment
+    return segment[0] + '*' * (len(segment) - 2) + segment[-1]
+
+def _mask_hk_macau_permit(segment: str) -> str:
+    # 港澳通行证：隐藏中间4位
+    return segment[:2] + '****' + segment[6:] if len(segment) >= 9 else segment
+
+def _mask_plate(segment: str) -> str:
+    # 车牌：隐藏中间部分（如：粤B·****8）
+    if len(segment) < 7:
+        return segment
+    return _mask_positions(segment, [i for i in range(2, len(segment)-1) if segment[i].isalnum()])
+
+def _mask_full(segment: str) -> str:
+    # 其他语义类：全掩码
+    return '*' * len(segment)
+
+# 标签 -> 脱敏函数，导入时建好；未登记的标签走全掩码
+_HANDLERS: Dict[str, Callable[[str], str]] = {
+    "身份证号": _mask_idcard,
+    "手机号码": _mask_mobile,
+    "固定电话": _mask_landline,
+    "姓名": _mask_name,
+    "银行卡号": _mask_keep_last4,
+    "统一社会信用代码": _mask_keep_last4,
+    "护照号码": _mask_passport,
+    "港澳通行证": _mask_hk_macau_permit,
+    "车牌号码": _mask_plate,
+}
 
 def apply_masking(text: str, entities: List[dict]):
     """合并所有实体并执行脱敏"""
     # 1. 按起始位置排序
-    entities.sort(key=lambda x: x['start'])
+    entities.sort(key=itemgetter('start'))
     
     # 2. 合并重叠区间（注意：这里只合并真正重叠的区间，紧邻但不重叠的区间要分开处理）
     merged_spans = []
@@ -220,106 +306,40 @@ def apply_masking(text: str, entities: List[dict]):
             if label in MANDATORY_NUMERIC_SCHEMA:
                 merged_spans[-1][2] = label
     
-    # 3. 执行替换
+    # 3. 执行替换：区间已排序且互不重叠，按标签查表得到脱敏函数，逐段拼接后只 join 一次
     out = []
     prev = 0
     for s, e, label in merged_spans:
         out.append(text[prev:s])
-        
-        # 不同类型的脱敏策略
-        segment = text[s:e]
-        if label == "身份证号":
-            # 隐藏后六位
-            digits = [i for i, c in enumerate(segment) if c.isdigit() or c.lower() == 'x']
-            masked_seg = list(segment)
-            if len(digits) >= 6:
-                for i in digits[-6:]:
-                    masked_seg[i] = '*'
-            else:
-                for i in digits: masked_seg[i] = '*'
-            out.append("".join(masked_seg))
-        elif label == "手机号码":
-            # 手机号隐藏第4到第7位
-            digits = [i for i, c in enumerate(segment) if c.isdigit()]
-            masked_seg = list(segment)
-            if len(digits) >= 11:
-                # 针对11位及以上（含86）隐藏倒数第8到第5位，或简单处理
-                # 这里简单处理：隐藏中间4位
-                start_idx = 3 if len(digits) == 11 else len(digits) - 8
-                for i in digits[start_idx : start_idx + 4]:
-                    masked_seg[i] = '*'
-            out.append("".join(masked_seg))
-        elif label == "固定电话":
-            # 固定电话中间部分掩码
-            digits = [i for i, c in enumerate(segment) if c.isdigit()]
-            masked_seg = list(segment)
-            mid = len(digits) // 2
-            for i in digits[max(0, mid-2):mid+2]:
-                masked_seg[i] = '*'
-            out.append("".join(masked_seg))
-        elif label == "姓名":
-            # 隐藏第一个字
-            masked_seg = list(segment)
-            if len(masked_seg) > 0:
-                masked_seg[0] = '*'
-            out.append("".join(masked_seg))
-        elif label in ["银行卡号", "统一社会信用代码"]:
-            # 保留末尾4位
-            digits = [i for i, c in enumerate(segment) if c.isdigit() or c.isalpha()]
-            masked_seg = list(segment)
-            if len(digits) > 4:
-                for i in digits[:-4]:
-                    masked_seg[i] = '*'
-            else:
-                for i in digits: masked_seg[i] = '*'
-            out.append("".join(masked_seg))
-        elif label == "护照号码":
-            # 护照：保留首尾，中间掩码
-            masked_seg = list(segment)
-            if len(masked_seg) > 2:
-                for i in range(1, len(masked_seg)-1):
-                    masked_seg[i] = '*'
-            out.append("".join(masked_seg))
-        elif label == "港澳通行证":
-            # 港澳通行证：隐藏中间4位
-            masked_seg = list(segment)
-            if len(masked_seg) >= 9:
-                for i in range(2, 6):
-                    masked_seg[i] = '*'
-            out.append("".join(masked_seg))
-        elif label == "车牌号码":
-            # 车牌：隐藏中间部分
-            masked_seg = list(segment)
-            if len(masked_seg) >= 7:
-                # 隐藏第3到第5位（如：粤B·****8）
-                for i in range(2, len(masked_seg)-1):
-                    if masked_seg[i].isalnum():
-                        masked_seg[i] = '*'
-            out.append("".join(masked_seg))
-        else:
-            # 其他语义类：全掩码
-            out.append("*" * len(segment))
-            
+        out.append(_HANDLERS.get(label, _mask_full)(text[s:e]))
         prev = e
     out.append(text[prev:])
     return "".join(out)
 
-# ---- API 路由 ----
-
-@app.post("/mask/custom")
-def mask_custom(req: MaskRequest):
-    if not req.text.strip():
-        raise HTTPException(status_code=400, detail="text is empty")
+# 实体识别结果缓存：文本 + 类型 + 分段长度相同时结果确定，批量处理重复文档时可跳过 Taskflow
+_ENTITY_CACHE_SIZE = 64
+_ENTITY_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_ENTITY_CACHE_LOCK = threading.Lock()
 
-    selected_labels = req.schemalist or []
+def _find_entities(text: str, selected_labels: List[str], max_chunk_len: int) -> tuple:
+    """识别并合并全部实体，返回按起始位置排序的实体元组（带 LRU 缓存）"""
+    key = (text, tuple(selected_labels), max_chunk_len)
+    with _ENTITY_CACHE_LOCK:
+        cached = _ENTITY_CACHE.get(key)
+        if cached is not None:
+            _ENTITY_CACHE.move_to_end(key)
+            return cached
 
     # 1. 正则匹配 (数字类)
     numeric_to_match = [l for l in selected_labels if l in MANDATORY_NUMERIC_SCHEMA]
-    regex_ents = get_regex_entities(req.text, numeric_to_match) if numeric_to_match else []
+    regex_ents = get_regex_entities(text, numeric_to_match) if numeric_to_match else []
 
     # 2. Taskflow 匹配 (语义类)
     tf_labels = [l for l in selected_labels if l not in MANDATORY_NUMERIC_SCHEMA]
-    tf_ents = get_taskflow_entities(req.text, tf_labels, max_chunk_len=req.max_chunk_len or 300) if tf_labels else []
+    tf_ents = get_taskflow_entities(text, tf_labels, max_chunk_len=max_chunk_len) if tf_labels else []
+    # 推理失败的结果不缓存，下次请求重新识别
+    cacheable = tf_ents is not None
+    tf_ents = tf_ents or []
 
     # 3. 二次扫描与合并实体（这一整段逻辑也从你现在的文件里原样复制即可）
     final_ents_map = {}
@@ -333,8 +353,12 @@ def mask_custom(req: MaskRequest):
         if t and t not in tf_text_to_label:
             tf_text_to_label[t] = l
 
-    for t, l in tf_text_to_label.items():
-        for m in re.finditer(re.escape(t), req.text, re.IGNORECASE):
+    # 全文二次扫描：所有实体文本合并为一个正则，只扫描一遍原文
+    # 长文本排在前面，同一位置优先匹配更长的实体；同长度保持首次出现的顺序
+    if tf_text_to_label:
+        texts = sorted(tf_text_to_label, key=len, reverse=True)
+        rescan = re.compile("|".join(f"(?P<t{i}>{re.escape(t)})" for i, t in enumerate(texts)), re.IGNORECASE)
+        for m in rescan.finditer(text):
             span = (m.start(), m.end())
             if span in final_ents_map:
                 continue
@@ -342,7 +366,7 @@ def mask_custom(req: MaskRequest):
                 final_ents_map[span] = tf_original_map[span]
             else:
                 final_ents_map[span] = {
-                    "label": l,
+                    "label": tf_text_to_label[texts[int(m.lastgroup[1:])]],
                     "start": m.start(),
                     "end": m.end(),
                     "text": m.group(),
@@ -353,7 +377,25 @@ def mask_custom(req: MaskRequest):
         if span not in final_ents_map:
             final_ents_map[span] = ent
 
-    global_ents = sorted(final_ents_map.values(), key=lambda x: x["start"])
+    global_ents = tuple(sorted(final_ents_map.values(), key=itemgetter("start")))
+    if cacheable:
+        with _ENTITY_CACHE_LOCK:
+            _ENTITY_CACHE[key] = global_ents
+            if len(_ENTITY_CACHE) > _ENTITY_CACHE_SIZE:
+                _ENTITY_CACHE.popitem(last=False)
+    return global_ents
+
+# ---- API 路由 ----
+
+@app.post("/mask/custom")
+def mask_custom(req: MaskRequest):
+    if not req.text.strip():
+        raise HTTPException(status_code=400, detail="text is empty")
+
+    selected_labels = req.schemalist or []
+    tf_labels = [l for l in selected_labels if l not in MANDATORY_NUMERIC_SCHEMA]
+
+    global_ents = list(_find_entities(req.text, selected_labels, req.max_chunk_len or 300))
     masked_text = apply_masking(req.text, global_ents)
 
     return {
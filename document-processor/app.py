@@ -9,7 +9,7 @@ from typing import List, Optional
 import httpx
 import sys
 import os
-import json
+import orjson
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -38,6 +38,12 @@ pdf_processor = PdfProcessor(
     pdf_parse_api_url=settings.PDF_PARSE_API_URL
 )
 
+@app.on_event("shutdown")
+async def close_http_clients():
+    """服务停止时关闭处理器共享的HTTP客户端"""
+    await word_processor.aclose()
+    await pdf_processor.aclose()
+
 @app.get("/health")
 async def health_check():
     """健康检查"""
@@ -68,8 +74,8 @@ async def process_word(
         schema_list = None
         if schemalist:
             try:
-                schema_list = json.loads(schemalist)
-            except json.JSONDecodeError:
+                schema_list = orjson.loads(schemalist)
+            except orjson.JSONDecodeError:
                 # 如果不是JSON，尝试按逗号分割
                 schema_list = [s.strip() for s in schemalist.split(',') if s.strip()]
         
@@ -123,8 +129,8 @@ async def process_pdf(
         schema_list = None
         if schemalist:
             try:
-                schema_list = json.loads(schemalist)
-            except json.JSONDecodeError:
+                schema_list = orjson.loads(schemalist)
+            except orjson.JSONDecodeError:
                 # 如果不是JSON，尝试按逗号分割
                 schema_list = [s.strip() for s in schemalist.split(',') if s.strip()]
         
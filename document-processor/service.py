@@ -3,17 +3,28 @@ Word文档处理服务 - 基于OpenXML实现
 流程：Word (.docx) → OpenXML (document.xml) → 解析/替换 → 回写 → 新的 Word (.docx)
 """
 import os
+import asyncio
 import httpx
+import numpy as np
 import zipfile
-import tempfile
-import xml.etree.ElementTree as ET
+import struct
+import copy
+from pathlib import Path
+from array import array
+from lxml import etree
 from io import BytesIO
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
 import sys
 import re
 import logging
-import json
+import threading
+import orjson
+import html
+import hashlib
+from xml.sax.saxutils import escape as xml_escape
 from datetime import datetime
+from collections import OrderedDict
+from operator import itemgetter
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -32,7 +43,172 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Word XML命名空间
-W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_NS_URI = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+W_NS = f'{{{W_NS_URI}}}'
+
+# 预编译的<w:t>查询，按文档顺序返回所有文本元素
+_W_T_XPATH = etree.XPath('.//w:t', namespaces={'w': W_NS_URI})
+
+# 共享HTTP客户端的连接池上限
+_HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+# orjson 编码的请求体需要显式声明类型
+_JSON_HEADERS = {'content-type': 'application/json'}
+
+# PDF脱敏结果的LRU缓存容量（按文本+参数的SHA-256寻址）
+_MASK_CACHE_SIZE = 128
+
+# 文本输出的写缓冲大小，以及每次编码写入的字符数
+_WRITE_BUFFER_SIZE = 1 << 16
+
+# 原始XML（UTF-8字节）中的<w:t>元素：group(1)为文本内容，自闭合的<w:t/>没有文本
+_W_T_RE = re.compile(rb'<w:t(?=[\s/>])[^>]*?(?:/>|>([^<]*)</w:t>)')
+
+# XML声明及其后的空白（可带UTF-8 BOM）
+_XML_DECL_RE = re.compile(rb'(?:\xef\xbb\xbf)?<\?xml[^?]*\?>\s*')
+
+
+async def _post_desensitive(client: httpx.AsyncClient, endpoint: str, text: str,
+                            schemalist: List[str], max_chunk_len: int) -> Dict:
+    """发送一次脱敏请求；纯空白文本服务端会拒绝，直接原样返回"""
+    if not text.strip():
+        return {'masked': text, 'entities_found': []}
+    payload = {
+        "text": text,
+        "schemalist": schemalist,
+        "max_chunk_len": max_chunk_len
+    }
+    response = await client.post(endpoint, content=orjson.dumps(payload), headers=_JSON_HEADERS)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+def _copy_zip_entry_raw(zip_in: zipfile.ZipFile, zip_out: zipfile.ZipFile, info: zipfile.ZipInfo):
+    """
+    按原始压缩数据直接复制ZIP条目，跳过解压和重新压缩
+    
+    压缩数据从源文件本地文件头之后读取（长度为 compress_size），
+    在目标文件中写入新的本地文件头后原样追加，并登记到中央目录。
+    """
+    fp = zip_in.fp
+    fp.seek(info.header_offset)
+    header = fp.read(zipfile.sizeFileHeader)
+    # 本地文件头第26-30字节为文件名长度和扩展字段长度
+    fname_len, extra_len = struct.unpack('<HH', header[26:30])
+    fp.seek(info.header_offset + zipfile.sizeFileHeader + fname_len + extra_len)
+    raw = fp.read(info.compress_size)
+    
+    out_info = copy.copy(info)
+    # CRC和大小已写入本地文件头，不再需要数据描述符
+    out_info.flag_bits &= ~0x08
+    out_info.header_offset = zip_out.fp.tell()
+    zip_out.fp.write(out_info.FileHeader())
+    zip_out.fp.write(raw)
+    zip_out.filelist.append(out_info)
+    zip_out.NameToInfo[out_info.filename] = out_info
+    zip_out.start_dir = zip_out.fp.tell()
+
+# Markdown转PDF的基本样式（支持中文）
+_PDF_CSS = """
+@page {
+    size: A4;
+    margin: 2cm;
+}
+body {
+    font-family: "SimSun", "宋体", "STSong", "Arial", sans-serif;
+    font-size: 12pt;
+    line-height: 1.6;
+    color: #333;
+}
+h1, h2, h3, h4, h5, h6 {
+    font-family: "SimHei", "黑体", "STHeiti", "Arial", sans-serif;
+    margin-top: 1em;
+    margin-bottom: 0.5em;
+}
+table {
+    border-collapse: collapse;
+    width: 100%;
+    margin: 1em 0;
+}
+table th, table td {
+    border: 1px solid #ddd;
+    padding: 8px;
+    text-align: left;
+}
+table th {
+    background-color: #f2f2f2;
+    font-weight: bold;
+}
+code {
+    background-color: #f4f4f4;
+    padding: 2px 4px;
+    border-radius: 3px;
+    font-family: "Courier New", monospace;
+}
+pre {
+    background-color: #f4f4f4;
+    padding: 10px;
+    border-radius: 5px;
+    overflow-x: auto;
+}
+"""
+
+# Markdown中原样透传的外部资源标签：WeasyPrint会逐个加载<link>引用的样式表，<script>不会执行，渲染前一并去掉
+_LINK_RE = re.compile(r'<link\b[^>]*>', re.I)
+_SCRIPT_RE = re.compile(r'<script\b.*?</script\s*>', re.I | re.S)
+
+# markdown / weasyprint 只在首次转换PDF时导入（weasyprint 依赖系统图形库，Word处理不需要）
+_PDF_RENDERER = None
+# PDF渲染在线程池中执行：共享组件的创建需要加锁
+_PDF_RENDERER_LOCK = threading.Lock()
+# Markdown实例非线程安全，线程池中每个线程各自持有一个并反复复用
+_MD_LOCAL = threading.local()
+
+def _get_pdf_renderer():
+    """
+    返回共享的PDF渲染组件，首次调用时导入并创建
+    
+    Returns:
+        (当前线程的Markdown实例, HTML类, 预解析的CSS, FontConfiguration)
+    """
+    global _PDF_RENDERER
+    if _PDF_RENDERER is None:
+        with _PDF_RENDERER_LOCK:
+            if _PDF_RENDERER is None:
+                import markdown
+                from weasyprint import HTML, CSS
+                from weasyprint.text.fonts import FontConfiguration
+                
+                # 字体发现开销较大，所有文档共用一个FontConfiguration
+                font_config = FontConfiguration()
+                _PDF_RENDERER = (
+                    markdown,
+                    HTML,
+                    CSS(string=_PDF_CSS, font_config=font_config),
+                    font_config,
+                )
+    markdown, HTML, css, font_config = _PDF_RENDERER
+    
+    md = getattr(_MD_LOCAL, 'md', None)
+    if md is None:
+        md = _MD_LOCAL.md = markdown.Markdown(extensions=['extra', 'codehilite', 'tables'])
+    return md, HTML, css, font_config
+
+
+def _write_text(path: str, text: str):
+    """以UTF-8写入文本文件（供线程池调用），分段编码写入，不生成整篇文本的字节副本"""
+    with open(path, 'w', encoding='utf-8', buffering=_WRITE_BUFFER_SIZE) as f:
+        for i in range(0, len(text), _WRITE_BUFFER_SIZE):
+            f.write(text[i:i + _WRITE_BUFFER_SIZE])
+
+
+def _stat_or_none(path: str) -> Optional[os.stat_result]:
+    """一次stat获取文件信息，文件不存在或不可访问时返回None"""
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
 
 class WordProcessor:
     """Word文档处理器 - 基于OpenXML"""
@@ -41,71 +217,93 @@ class WordProcessor:
         self.desensitive_service_url = desensitive_service_url
         self.upload_dir = "uploads"
         self.output_dir = "outputs"
+        self._out_dir = Path(self.output_dir)  # 输出文件路径基于此拼接
         self.debug_dir = "debug_outputs"  # 调试输出目录
+        self._client = None  # 共享的HTTP客户端，首次请求时创建
         self._ensure_directories()
     
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取共享的HTTP客户端，跨请求复用连接"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=120.0, limits=_HTTP_LIMITS)
+        return self._client
+    
+    async def aclose(self):
+        """关闭共享的HTTP客户端（服务停止时调用）"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
     def _ensure_directories(self):
         """确保必要的目录存在"""
         os.makedirs(self.upload_dir, exist_ok=True)
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.debug_dir, exist_ok=True)
     
-    def _extract_text_from_xml(self, xml_content: str) -> Tuple[str, List[Dict], ET.Element]:
+    def _extract_text_from_xml(self, xml_content: bytes) -> Tuple[str, Dict, etree._Element]:
         """
         从document.xml中提取纯文本，并记录每个文本节点的位置信息
         
+        节点映射按列存储（各列下标对齐）：
+            starts / ends: 节点文本在完整文本中的起止位置（array('q')）
+            elements: 所属的<w:t>元素
+            texts: 节点文本
+            is_tail: True 表示元素的tail文本，False 表示元素自身的text
+        
         Returns:
-            (完整文本, 文本节点映射列表, root元素)
+            (完整文本, 文本节点映射, root元素)
         """
         try:
-            root = ET.fromstring(xml_content)
-            text_parts = []
-            node_mapping = []
+            # 直接解析原始字节，无需先解码为 str
+            root = etree.fromstring(xml_content)
+            starts = array('q')
+            ends = array('q')
+            elements = []
+            texts = []
+            is_tail = []
             
             current_pos = 0
             
             # 遍历所有文本节点
-            for t_elem in root.iter(f'{W_NS}t'):
-                text = t_elem.text or ""
+            for t_elem in _W_T_XPATH(root):
+                text = t_elem.text
                 if text:
-                    start_pos = current_pos
-                    end_pos = current_pos + len(text)
-                    text_parts.append(text)
-                    node_mapping.append({
-                        'start': start_pos,
-                        'end': end_pos,
-                        'element': t_elem,
-                        'text': text,
-                        'is_text': True,
-                        'is_tail': False
-                    })
-                    current_pos = end_pos
+                    starts.append(current_pos)
+                    current_pos += len(text)
+                    ends.append(current_pos)
+                    elements.append(t_elem)
+                    texts.append(text)
+                    is_tail.append(False)
                 
                 # 处理tail文本（元素后的文本），如果只处理text会丢失文本格式信息！
-                if t_elem.tail:
-                    tail_text = t_elem.tail
-                    start_pos = current_pos
-                    end_pos = current_pos + len(tail_text)
-                    text_parts.append(tail_text)
-                    node_mapping.append({
-                        'start': start_pos,
-                        'end': end_pos,
-                        'element': t_elem,
-                        'text': tail_text,
-                        'is_text': False,
-                        'is_tail': True
-                    })
-                    current_pos = end_pos
+                tail_text = t_elem.tail
+                if tail_text:
+                    starts.append(current_pos)
+                    current_pos += len(tail_text)
+                    ends.append(current_pos)
+                    elements.append(t_elem)
+                    texts.append(tail_text)
+                    is_tail.append(True)
             
-            full_text = ''.join(text_parts)
-            logger.info(f"提取文本完成，文本长度: {len(full_text)}, 节点数量: {len(node_mapping)}")
+            full_text = ''.join(texts)
+            node_mapping = {
+                'starts': starts,
+                'ends': ends,
+                'elements': elements,
+                'texts': texts,
+                'is_tail': is_tail,
+            }
+            logger.info(f"提取文本完成，文本长度: {len(full_text)}, 节点数量: {len(texts)}")
             return full_text, node_mapping, root
         except Exception as e:
             logger.error(f"提取文本失败: {e}", exc_info=True)
             raise
     
     def _save_debug_info(self, filename: str, step: str, data: any, data_type: str = "text"):
-        """保存调试信息"""
+        """保存调试信息（未开启 DEBUG_ENABLED 时直接返回）"""
+        if not settings.DEBUG_ENABLED:
+            return None
+        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_name = os.path.splitext(filename)[0]
         debug_file = os.path.join(self.debug_dir, f"{base_name}_{step}_{timestamp}")
@@ -113,12 +311,12 @@ class WordProcessor:
         try:
             if data_type == "xml":
                 debug_file += ".xml"
-                with open(debug_file, 'w', encoding='utf-8') as f:
+                with open(debug_file, 'wb') as f:
                     f.write(data)
             elif data_type == "json":
                 debug_file += ".json"
-                with open(debug_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                with open(debug_file, 'wb') as f:
+                    f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
             else:
                 debug_file += ".txt"
                 with open(debug_file, 'w', encoding='utf-8') as f:
@@ -130,6 +328,13 @@ class WordProcessor:
             logger.error(f"保存调试信息失败: {e}", exc_info=True)
             return None
     
+    async def _save_debug_info_async(self, filename: str, step: str, data: any, data_type: str = "text"):
+        """在线程池中保存调试信息，避免磁盘写入阻塞事件循环"""
+        if not settings.DEBUG_ENABLED:
+            return None
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._save_debug_info, filename, step, data, data_type)
+    
     def _generate_replacements(self, original_text: str, masked_text: str, 
                               entities: List[Dict]) -> List[Dict]:
         """
@@ -143,33 +348,42 @@ class WordProcessor:
         Returns:
             替换映射列表，按start位置排序
         """
+        # 没有任何改动时无需比对
+        if masked_text == original_text:
+            logger.info("脱敏前后文本相同，没有替换项")
+            return []
+        
         replacements = []
+        # 循环内的调试日志先判断级别，未开启DEBUG时不构造日志参数
+        debug_log = logger.isEnabledFor(logging.DEBUG)
         
         logger.info(f"生成替换映射 - 原始文本长度: {len(original_text)}, 脱敏文本长度: {len(masked_text)}")
         
         # 方法：使用简单的字符比对，找出所有不同的连续段
         # 脱敏算法通常保持文本长度不变（只替换字符），所以优先使用逐字符比对
         if len(original_text) == len(masked_text):
-            i = 0
-            while i < len(original_text):
-                if original_text[i] != masked_text[i]:
-                    start = i
-                    # 找到差异段的结束位置
-                    while i < len(original_text) and original_text[i] != masked_text[i]:
-                        i += 1
-                    end = i
+            # UTF-32 下每个字符定长 4 字节，转成码点数组后向量化比较，一次得到全部差异位置
+            a = np.frombuffer(original_text.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+            b = np.frombuffer(masked_text.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+            mask = a != b
+            if mask.any():
+                # 两端补 False 后做差分：+1 处为差异段起点，-1 处为差异段终点（不含）
+                edges = np.diff(np.concatenate(([False], mask, [False])).view(np.int8))
+                starts = np.flatnonzero(edges == 1).tolist()
+                ends = np.flatnonzero(edges == -1).tolist()
+                for start, end in zip(starts, ends):
                     replacements.append({
                         'start': start,
                         'end': end,
                         'new_text': masked_text[start:end]
                     })
-                    logger.debug(f"发现差异段: [{start}:{end}] '{original_text[start:end]}' -> '{masked_text[start:end]}'")
-                else:
-                    i += 1
+                    if debug_log:
+                        logger.debug("发现差异段: [%d:%d] '%s' -> '%s'",
+                                     start, end, original_text[start:end], masked_text[start:end])
         else:
             # 长度不同，使用基于实体的替换
             logger.warning(f"文本长度不同，使用基于实体的替换方法")
-            sorted_entities = sorted(entities, key=lambda x: x['start'])
+            sorted_entities = sorted(entities, key=itemgetter('start'))
             
             for entity in sorted_entities:
                 start = entity['start']
@@ -187,11 +401,12 @@ class WordProcessor:
                             'end': end,
                             'new_text': masked_segment
                         })
-                        logger.debug(f"实体替换: [{start}:{end}] '{original_segment}' -> '{masked_segment}'")
+                        if debug_log:
+                            logger.debug("实体替换: [%d:%d] '%s' -> '%s'", start, end, original_segment, masked_segment)
         
         # 合并重叠的替换项
         if replacements:
-            replacements = sorted(replacements, key=lambda x: x['start'])
+            replacements = sorted(replacements, key=itemgetter('start'))
             merged = []
             for rep in replacements:
                 if not merged or rep['start'] >= merged[-1]['end']:
@@ -206,19 +421,19 @@ class WordProcessor:
         logger.info(f"生成替换映射完成，共 {len(replacements)} 个替换项")
         return replacements
     
-    def _apply_replacements_to_xml(self, xml_content: str, replacements: List[Dict],
-                                  node_mapping: List[Dict], root: ET.Element) -> str:
+    def _apply_replacements_to_xml(self, xml_content: bytes, replacements: List[Dict],
+                                  node_mapping: Dict, root: etree._Element) -> bytes:
         """
         在XML中应用文本替换 - 使用最简单的方法：直接在原始XML字符串上替换
         
         Args:
-            xml_content: 原始XML内容（完全保留原始格式和命名空间）
+            xml_content: 原始XML内容（UTF-8字节，完全保留原始格式和命名空间）
             replacements: 替换映射列表，按start位置排序
-            node_mapping: 文本节点映射（用于定位文本在XML中的位置）
-            root: XML根元素（未使用，保留以兼容接口）
+            node_mapping: 文本节点映射（按列存储，见 _extract_text_from_xml）
+            root: XML根元素（回退到整树序列化时使用）
         
         Returns:
-            修改后的XML内容
+            修改后的XML内容（UTF-8字节）
         """
         try:
             # 如果没有替换项，直接返回原始XML
@@ -226,85 +441,139 @@ class WordProcessor:
                 logger.info("没有替换项，返回原始XML")
                 return xml_content
             
-            # 最简单可靠的方法：修改ElementTree节点，然后重新序列化
-            # 但保留原始XML的根元素标签（包含所有命名空间声明）
+            # 先修改树中的节点文本，再写回XML（见下方的按位置拼接与整树序列化回退）
             
-            # 按位置排序替换项（从后往前处理，避免位置偏移）
-            sorted_replacements = sorted(replacements, key=lambda x: x['start'], reverse=True)
+            # 替换项按起始位置升序排列；_generate_replacements 已合并重叠项，结束位置同样单调
+            sorted_replacements = sorted(replacements, key=itemgetter('start'))
             
             logger.info(f"开始应用 {len(sorted_replacements)} 个替换项到XML")
             
-            # 修改ElementTree节点
+            # 修改节点：节点与替换项都按位置有序，每个节点只与真正重叠的替换项比较
+            # 替换项的起止位置存为并列数组，用 searchsorted 一次求出每个节点第一个
+            # 结束位置大于节点起点的替换项，即可能重叠的第一个替换项
+            rep_count = len(sorted_replacements)
+            rep_starts = [rep['start'] for rep in sorted_replacements]
+            rep_ends = np.fromiter((rep['end'] for rep in sorted_replacements), dtype=np.int64, count=rep_count)
+            node_starts = np.frombuffer(node_mapping['starts'], dtype=np.int64)
+            first_reps = np.searchsorted(rep_ends, node_starts, side='right').tolist()
+            node_starts_list = node_mapping['starts']
+            
             modified_count = 0
-            for node_info in node_mapping:
-                elem = node_info['element']
-                node_start = node_info['start']
-                node_end = node_info['end']
-                is_text = node_info.get('is_text', False)
-                is_tail = node_info.get('is_tail', False)
-                original_text = node_info.get('text', '')
-                
-                if not (is_text or is_tail) or not original_text:
+            # 记录发生变化的<w:t>文本：element -> (原文本, 新文本)；tail 被修改时只能整树序列化
+            changed_texts = {}
+            tail_modified = False
+            debug_log = logger.isEnabledFor(logging.DEBUG)
+            elements = node_mapping['elements']
+            texts = node_mapping['texts']
+            tail_flags = node_mapping['is_tail']
+            node_ends = node_mapping['ends']
+            for i, first_rep in enumerate(first_reps):
+                # 没有任何替换项与该节点重叠
+                if first_rep >= rep_count:
+                    break
+                node_end = node_ends[i]
+                if rep_starts[first_rep] >= node_end:
                     continue
+                node_start = node_starts_list[i]
+                original_text = texts[i]
                 
-                # 检查哪些替换项影响这个节点
-                modified_text = original_text
-                
-                for rep in sorted_replacements:
-                    rep_start = rep['start']
-                    rep_end = rep['end']
-                    
-                    if rep_start < node_end and rep_end > node_start:
-                        local_start = max(0, rep_start - node_start)
-                        local_end = min(len(original_text), rep_end - node_start)
-                        
-                        if local_start < local_end:
-                            new_segment = rep['new_text']
-                            modified_text = (
-                                modified_text[:local_start] + 
-                                new_segment + 
-                                modified_text[local_end:]
-                            )
+                # 逐段拼接新文本，最后只 join 一次
+                pieces = []
+                cursor = 0
+                j = first_rep
+                while j < rep_count and rep_starts[j] < node_end:
+                    rep = sorted_replacements[j]
+                    local_start = max(0, rep['start'] - node_start)
+                    local_end = min(len(original_text), rep['end'] - node_start)
+                    if local_start < local_end:
+                        pieces.append(original_text[cursor:local_start])
+                        pieces.append(rep['new_text'])
+                        cursor = local_end
+                    j += 1
                 
                 # 更新节点文本
-                if modified_text != original_text:
-                    if is_text:
-                        elem.text = modified_text
-                    elif is_tail:
-                        elem.tail = modified_text
-                    modified_count += 1
-                    logger.debug(f"更新节点文本: '{original_text}' -> '{modified_text}'")
+                if pieces:
+                    pieces.append(original_text[cursor:])
+                    modified_text = ''.join(pieces)
+                    if modified_text != original_text:
+                        elem = elements[i]
+                        if tail_flags[i]:
+                            elem.tail = modified_text
+                            tail_modified = True
+                        else:
+                            elem.text = modified_text
+                            changed_texts[elem] = (original_text, modified_text)
+                        modified_count += 1
+                        if debug_log:
+                            logger.debug("更新节点文本: '%s' -> '%s'", original_text, modified_text)
             
             logger.info(f"完成XML节点修改，修改了 {modified_count} 个节点")
             
-            # 简单序列化：直接序列化整个XML树，不做复杂的命名空间修复
-            # 注意：这可能会导致命名空间前缀变成ns0:、ns1:等，Word可能会提示"无法读取的内容"
-            # 但用户点击"是"后可以正常打开和使用
-            result = ET.tostring(root, encoding='unicode', method='xml', xml_declaration=False)
-            
-            # 添加XML声明
-            if xml_content.strip().startswith('<?xml'):
-                xml_declaration_end = xml_content.find('?>') + 2
-                next_char_idx = xml_declaration_end
-                while next_char_idx < len(xml_content) and xml_content[next_char_idx] in ['\n', '\r', ' ']:
-                    next_char_idx += 1
-                original_declaration = xml_content[:next_char_idx]
-                result = original_declaration + result
-            
-            # 验证XML格式
-            try:
-                ET.fromstring(result)
-                logger.info("XML格式验证通过")
-            except ET.ParseError as e:
-                logger.error(f"XML格式验证失败: {e}")
-                logger.error(f"错误位置: {e.position if hasattr(e, 'position') else 'unknown'}")
-                return xml_content
+            # 优先在原始XML上只替换发生变化的<w:t>文本，其余字节原样保留
+            result = None
+            if not tail_modified:
+                result = self._splice_text_nodes(xml_content, root, changed_texts)
+            
+            if result is None:
+                # 无法与原始XML可靠对齐时，回退为序列化整个XML树
+                # lxml 保留原始命名空间前缀（不会出现 ns0:、ns1:）
+                logger.info("回退为整树序列化")
+                result = etree.tostring(root, encoding='utf-8', method='xml', xml_declaration=False)
+                
+                # 添加原始XML声明
+                decl = _XML_DECL_RE.match(xml_content)
+                if decl:
+                    result = xml_content[:decl.end()] + result
+            
+            # 验证XML格式：替换文本均已转义，结果必然合法，完整重新解析只在调试模式下进行
+            if settings.DEBUG_ENABLED:
+                try:
+                    etree.fromstring(result)
+                    logger.info("XML格式验证通过")
+                except etree.XMLSyntaxError as e:
+                    logger.error(f"XML格式验证失败: {e}")
+                    logger.error(f"错误位置: {e.position if hasattr(e, 'position') else 'unknown'}")
+                    return xml_content
             
             return result
         except Exception as e:
             logger.error(f"应用替换到XML失败: {e}", exc_info=True)
             raise
     
+    def _splice_text_nodes(self, xml_content: bytes, root: etree._Element,
+                           changed_texts: Dict) -> Optional[bytes]:
+        """
+        在原始XML字节上按位置替换发生变化的<w:t>文本
+        
+        按文档顺序把正则扫描到的<w:t>与解析树中的元素一一对应，
+        只对变化的元素拼接新文本，其余内容原样保留。
+        
+        Returns:
+            拼接后的XML；数量或原文本对不上时返回None
+        """
+        elements = _W_T_XPATH(root)
+        matches = list(_W_T_RE.finditer(xml_content))
+        if len(elements) != len(matches):
+            logger.warning(f"<w:t>数量不一致（解析 {len(elements)} / 扫描 {len(matches)}），无法按位置替换")
+            return None
+        
+        pieces = []
+        cursor = 0
+        for elem, match in zip(elements, matches):
+            change = changed_texts.get(elem)
+            if change is None:
+                continue
+            original_text, new_text = change
+            raw = match.group(1)
+            if raw is None or html.unescape(raw.decode('utf-8')) != original_text:
+                logger.warning(f"<w:t>原文本不一致，无法按位置替换: '{original_text}'")
+                return None
+            pieces.append(xml_content[cursor:match.start(1)])
+            pieces.append(xml_escape(new_text).encode('utf-8'))
+            cursor = match.end(1)
+        pieces.append(xml_content[cursor:])
+        return b''.join(pieces)
+    
     async def process_document(self, file_content: bytes, filename: str, 
                                schemalist: List[str] = None, 
                                max_chunk_len: int = 300) -> str:
@@ -322,129 +591,139 @@ class WordProcessor:
         """
         logger.info(f"开始处理Word文档: {filename}")
         
-        # 使用临时目录处理文件
-        with tempfile.TemporaryDirectory() as temp_dir:
-            try:
-                # 1. 解压docx文件（docx本质是zip）
-                docx_path = os.path.join(temp_dir, "input.docx")
-                with open(docx_path, 'wb') as f:
-                    f.write(file_content)
+        try:
+            # 1. 在内存中打开docx文件（docx本质是zip），无需先写入临时文件
+            src_buf = BytesIO(file_content)
+            
+            logger.info("步骤1: 读取docx文件完成")
+            
+            # 2. 提取document.xml
+            with zipfile.ZipFile(src_buf, 'r') as zip_in:
+                # 读取document.xml
+                document_xml = zip_in.read('word/document.xml')
                 
-                logger.info("步骤1: 解压docx文件完成")
+                # 保存原始XML用于调试
+                await self._save_debug_info_async(filename, "01_original_xml", document_xml, "xml")
                 
-                # 2. 提取document.xml
-                with zipfile.ZipFile(docx_path, 'r') as zip_ref:
-                    # 读取document.xml
-                    document_xml = zip_ref.read('word/document.xml').decode('utf-8')
-                    
-                    # 保存原始XML用于调试
-                    self._save_debug_info(filename, "01_original_xml", document_xml, "xml")
-                    
-                    logger.info("步骤2: 提取document.xml完成")
-                    
-                    # 3. 从XML中提取纯文本（同时返回root以便后续使用）
-                    full_text, node_mapping, xml_root = self._extract_text_from_xml(document_xml)
-                    
-                    # 保存提取的文本用于调试
-                    self._save_debug_info(filename, "02_extracted_text", full_text, "text")
-                    # 保存节点映射时，移除Element对象以避免序列化错误
+                logger.info("步骤2: 提取document.xml完成")
+                
+                # 3. 从XML中提取纯文本（同时返回root以便后续使用）
+                full_text, node_mapping, xml_root = self._extract_text_from_xml(document_xml)
+                
+                # 保存提取的文本用于调试
+                await self._save_debug_info_async(filename, "02_extracted_text", full_text, "text")
+                # 保存节点映射时，移除Element对象以避免序列化错误
+                if settings.DEBUG_ENABLED:
                     node_mapping_for_debug = []
-                    for node in (node_mapping[:10] if len(node_mapping) > 10 else node_mapping):
+                    for i in range(min(10, len(node_mapping['texts']))):
                         debug_node = {
-                            'start': node['start'],
-                            'end': node['end'],
-                            'text': node.get('text', ''),
-                            'is_text': node.get('is_text', False),
-                            'is_tail': node.get('is_tail', False),
-                            'tag': node['element'].tag if hasattr(node['element'], 'tag') else str(node['element'])
+                            'start': node_mapping['starts'][i],
+                            'end': node_mapping['ends'][i],
+                            'text': node_mapping['texts'][i],
+                            'is_text': not node_mapping['is_tail'][i],
+                            'is_tail': node_mapping['is_tail'][i],
+                            'tag': node_mapping['elements'][i].tag
                         }
                         node_mapping_for_debug.append(debug_node)
-                    self._save_debug_info(filename, "03_node_mapping", {
-                        'total_nodes': len(node_mapping),
+                    await self._save_debug_info_async(filename, "03_node_mapping", {
+                        'total_nodes': len(node_mapping['texts']),
                         'sample_nodes': node_mapping_for_debug
                     }, "json")
-                    
-                    if not full_text.strip():
-                        # 如果没有文本内容，直接复制原文件
-                        logger.warning("文档中没有文本内容，直接复制原文件")
-                        output_path = os.path.join(self.output_dir, f"desensitized_{filename}")
-                        with open(output_path, 'wb') as f:
-                            f.write(file_content)
-                        return output_path
-                    
-                    # 4. 调用脱敏服务
-                    logger.info(f"步骤3: 调用脱敏服务，文本长度: {len(full_text)}")
-                    desensitive_result = await self._call_desensitive_service(
-                        full_text, 
-                        schemalist=schemalist,
-                        max_chunk_len=max_chunk_len
-                    )
-                    
-                    masked_text = desensitive_result.get('masked', full_text)
-                    entities = desensitive_result.get('entities_found', [])
-                    
-                    # 保存脱敏结果用于调试
-                    self._save_debug_info(filename, "04_masked_text", masked_text, "text")
-                    self._save_debug_info(filename, "05_entities", {
+                
+                if not full_text.strip():
+                    # 如果没有文本内容，直接复制原文件
+                    logger.warning("文档中没有文本内容，直接复制原文件")
+                    output_path = str(self._out_dir / f"desensitized_{filename}")
+                    with open(output_path, 'wb') as f:
+                        f.write(file_content)
+                    return output_path
+                
+                # 4. 调用脱敏服务
+                logger.info(f"步骤3: 调用脱敏服务，文本长度: {len(full_text)}")
+                desensitive_result = await self._call_desensitive_service(
+                    full_text, 
+                    schemalist=schemalist,
+                    max_chunk_len=max_chunk_len
+                )
+                
+                masked_text = desensitive_result.get('masked', full_text)
+                entities = desensitive_result.get('entities_found', [])
+                
+                # 保存脱敏结果用于调试
+                await self._save_debug_info_async(filename, "04_masked_text", masked_text, "text")
+                if entities:
+                    await self._save_debug_info_async(filename, "05_entities", {
                         'total_entities': len(entities),
                         'entities': entities
                     }, "json")
-                    
-                    logger.info(f"步骤4: 脱敏完成，识别到 {len(entities)} 个实体")
-                    
-                    # 5. 比对原文本和脱敏后文本，生成替换映射
-                    replacements = self._generate_replacements(full_text, masked_text, entities)
-                    
-                    # 保存替换映射用于调试
-                    self._save_debug_info(filename, "06_replacements", {
-                        'total_replacements': len(replacements),
-                        'replacements': replacements
-                    }, "json")
-                    
-                    logger.info(f"步骤5: 生成替换映射完成，共 {len(replacements)} 个替换项")
-                    
-                    # 6. 在XML中应用替换（传入root以确保使用同一个元素引用）
-                    modified_xml = self._apply_replacements_to_xml(document_xml, replacements, node_mapping, xml_root)
-                    
-                    # 保存修改后的XML用于调试
-                    self._save_debug_info(filename, "07_modified_xml", modified_xml, "xml")
-                    
-                    logger.info("步骤6: XML替换完成")
-                    
-                    # 7. 重新打包docx
-                    output_path = os.path.join(self.output_dir, f"desensitized_{filename}")
-                    
-                    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
-                        # 复制所有原有文件
-                        with zipfile.ZipFile(docx_path, 'r') as zip_in:
-                            for item in zip_in.infolist():
-                                if item.filename == 'word/document.xml':
-                                    # 写入修改后的document.xml
-                                    zip_out.writestr(item.filename, modified_xml.encode('utf-8'))
-                                    logger.info(f"写入修改后的document.xml: {item.filename}")
-                                else:
-                                    # 复制其他文件
-                                    zip_out.writestr(item, zip_in.read(item.filename))
-                    
-                    logger.info(f"步骤7: 重新打包完成，输出文件: {output_path}")
-                    
-                    # 验证输出文件
-                    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                        logger.info(f"处理成功，文件大小: {os.path.getsize(output_path)} 字节")
-                    else:
-                        logger.error(f"输出文件验证失败: {output_path}")
-                    
+                
+                logger.info(f"步骤4: 脱敏完成，识别到 {len(entities)} 个实体")
+                
+                if masked_text == full_text:
+                    # 没有需要脱敏的内容，跳过比对、替换和重新打包，直接输出原文件
+                    logger.info("脱敏前后文本相同，直接输出原文件")
+                    output_path = str(self._out_dir / f"desensitized_{filename}")
+                    with open(output_path, 'wb') as f:
+                        f.write(file_content)
                     return output_path
-                    
-            except Exception as e:
-                logger.error(f"处理Word文档失败: {e}", exc_info=True)
-                # 保存错误信息
-                self._save_debug_info(filename, "99_error", {
-                    'error': str(e),
-                    'error_type': type(e).__name__
+                
+                # 5. 比对原文本和脱敏后文本，生成替换映射
+                replacements = self._generate_replacements(full_text, masked_text, entities)
+                
+                # 保存替换映射用于调试
+                await self._save_debug_info_async(filename, "06_replacements", {
+                    'total_replacements': len(replacements),
+                    'replacements': replacements
                 }, "json")
-                raise
-    
+                
+                logger.info(f"步骤5: 生成替换映射完成，共 {len(replacements)} 个替换项")
+                
+                # 6. 在XML中应用替换（传入root以确保使用同一个元素引用）
+                modified_xml = self._apply_replacements_to_xml(document_xml, replacements, node_mapping, xml_root)
+                
+                # 保存修改后的XML用于调试
+                await self._save_debug_info_async(filename, "07_modified_xml", modified_xml, "xml")
+                
+                logger.info("步骤6: XML替换完成")
+                
+                # 7. 重新打包docx：在内存中组装，最后一次性写入输出文件
+                output_path = str(self._out_dir / f"desensitized_{filename}")
+                
+                out_buf = BytesIO()
+                with zipfile.ZipFile(out_buf, 'w', zipfile.ZIP_DEFLATED) as zip_out:
+                    # 复制所有原有文件
+                    for item in zip_in.infolist():
+                        if item.filename == 'word/document.xml':
+                            # 写入修改后的document.xml
+                            zip_out.writestr(item.filename, modified_xml)
+                            logger.info(f"写入修改后的document.xml: {item.filename}")
+                        else:
+                            # 复制其他文件：直接拷贝压缩数据，不解压/重新压缩
+                            _copy_zip_entry_raw(zip_in, zip_out, item)
+                
+                with open(output_path, 'wb') as f:
+                    f.write(out_buf.getbuffer())
+                
+                logger.info(f"步骤7: 重新打包完成，输出文件: {output_path}")
+                
+                # 验证输出文件
+                st = _stat_or_none(output_path)
+                if st and st.st_size > 0:
+                    logger.info(f"处理成功，文件大小: {st.st_size} 字节")
+                else:
+                    logger.error(f"输出文件验证失败: {output_path}")
+                
+                return output_path
+                
+        except Exception as e:
+            logger.error(f"处理Word文档失败: {e}", exc_info=True)
+            # 保存错误信息
+            await self._save_debug_info_async(filename, "99_error", {
+                'error': str(e),
+                'error_type': type(e).__name__
+            }, "json")
+            raise
+
     async def _call_desensitive_service(self, text: str, 
                                        schemalist: List[str] = None,
                                        max_chunk_len: int = 300) -> Dict:
@@ -459,25 +738,22 @@ class WordProcessor:
         Returns:
             脱敏结果字典
         """
+        # 未选择任何实体类型时脱敏服务不会识别任何内容，直接返回原文，不发请求
+        if not schemalist:
+            logger.info("未选择脱敏实体类型，跳过脱敏服务调用")
+            return {'masked': text, 'entities_found': []}
+        
         # 注意：脱敏服务的端口是8888，接口是/mask/custom
         service_url = self.desensitive_service_url.replace(':8001', ':8888')
         endpoint = f"{service_url}/mask/custom"
         
-        payload = {
-            "text": text,
-            "schemalist": schemalist,
-            "max_chunk_len": max_chunk_len
-        }
-        
+        # 整篇文本一次发送：服务端的实体回扫需要看到全文，分片发送会漏掉跨片段重复出现的实体
         logger.info(f"调用脱敏服务: {endpoint}, 文本长度: {len(text)}")
         
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(endpoint, json=payload)
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"脱敏服务调用成功，识别到 {len(result.get('entities_found', []))} 个实体")
-                return result
+            result = await _post_desensitive(self._get_client(), endpoint, text, schemalist, max_chunk_len)
+            logger.info(f"脱敏服务调用成功，识别到 {len(result.get('entities_found', []))} 个实体")
+            return result
         except Exception as e:
             logger.error(f"调用脱敏服务失败: {e}", exc_info=True)
             raise
@@ -491,9 +767,27 @@ class PdfProcessor:
         self.pdf_parse_api_url = pdf_parse_api_url
         self.upload_dir = "uploads"
         self.output_dir = "outputs"
+        self._out_dir = Path(self.output_dir)  # 输出文件路径基于此拼接
         self.debug_dir = "debug_outputs"  # 调试输出目录
+        self._client = None  # 共享的HTTP客户端，首次请求时创建
+        self._mask_cache: "OrderedDict[str, Dict]" = OrderedDict()  # 脱敏结果LRU缓存
+        self._debug_tasks: set = set()  # 尚未完成的后台调试写入
         self._ensure_directories()
     
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取共享的HTTP客户端，跨请求复用连接"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=120.0, limits=_HTTP_LIMITS)
+        return self._client
+    
+    async def aclose(self):
+        """关闭共享的HTTP客户端（服务停止时调用），并等待后台调试写入完成"""
+        if self._debug_tasks:
+            await asyncio.gather(*self._debug_tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
     def _ensure_directories(self):
         """确保必要的目录存在"""
         os.makedirs(self.upload_dir, exist_ok=True)
@@ -501,7 +795,10 @@ class PdfProcessor:
         os.makedirs(self.debug_dir, exist_ok=True)
     
     def _save_debug_info(self, filename: str, step: str, data: any, data_type: str = "text"):
-        """保存调试信息"""
+        """保存调试信息（未开启 DEBUG_ENABLED 时直接返回）"""
+        if not settings.DEBUG_ENABLED:
+            return None
+        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_name = os.path.splitext(filename)[0]
         debug_file = os.path.join(self.debug_dir, f"{base_name}_{step}_{timestamp}")
@@ -509,8 +806,8 @@ class PdfProcessor:
         try:
             if data_type == "json":
                 debug_file += ".json"
-                with open(debug_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                with open(debug_file, 'wb') as f:
+                    f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
             else:
                 debug_file += ".txt"
                 with open(debug_file, 'w', encoding='utf-8') as f:
@@ -522,6 +819,17 @@ class PdfProcessor:
             logger.error(f"保存调试信息失败: {e}", exc_info=True)
             return None
     
+    def _spawn_debug(self, filename: str, step: str, data: any, data_type: str = "text") -> Optional[asyncio.Future]:
+        """在线程池中后台保存调试信息，调用方无需等待写入完成（未开启 DEBUG_ENABLED 时返回None）"""
+        if not settings.DEBUG_ENABLED:
+            return None
+        loop = asyncio.get_event_loop()
+        task = loop.run_in_executor(None, self._save_debug_info, filename, step, data, data_type)
+        # 保留引用直到写入完成
+        self._debug_tasks.add(task)
+        task.add_done_callback(self._debug_tasks.discard)
+        return task
+    
     async def _parse_pdf_to_markdown(self, file_content: bytes, filename: str) -> str:
         """
         调用PDF解析API将PDF转换为Markdown
@@ -563,45 +871,39 @@ class PdfProcessor:
         
         start_time = datetime.now()
         try:
-            # 直接使用requests库，与测试脚本保持一致
-            # 通过asyncio在线程池中运行，保持异步特性
-            import asyncio
-            import requests
-            
             logger.info("开始发送PDF解析请求...")
-            # 在线程池中运行同步的requests调用
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    parse_url,
-                    files=files,
-                    data=data,
-                    timeout=(10, 600)  # (connect_timeout, read_timeout)
-                )
-            )
-            
-            elapsed_time = (datetime.now() - start_time).total_seconds()
-            logger.info(f"PDF解析API响应时间: {elapsed_time:.2f} 秒")
-            
-            # 检查响应状态并处理错误
-            if response.status_code == 502:
-                error_msg = (
-                    f"PDF解析API服务不可用 (502 Bad Gateway)。"
-                    f"请检查PDF解析API服务是否正在运行: {self.pdf_parse_api_url}"
-                )
-                logger.error(error_msg)
-                raise ConnectionError(error_msg)
-            elif response.status_code != 200:
-                error_msg = f"PDF解析API返回错误: HTTP {response.status_code}"
-                try:
-                    error_body = response.text
-                    logger.error(f"{error_msg}, 响应内容: {error_body[:500]}")
-                except:
+            # 使用共享的异步httpx客户端，不占用线程池线程，并复用连接
+            # 以流式方式接收响应：先检查状态码，只有成功时才读取完整响应体
+            async with self._get_client().stream(
+                'POST',
+                parse_url,
+                files=files,
+                data=data,
+                timeout=httpx.Timeout(600.0, connect=10.0)  # 连接超时10秒，读取超时600秒
+            ) as response:
+                elapsed_time = (datetime.now() - start_time).total_seconds()
+                logger.info(f"PDF解析API响应时间: {elapsed_time:.2f} 秒")
+                
+                # 检查响应状态并处理错误
+                if response.status_code == 502:
+                    error_msg = (
+                        f"PDF解析API服务不可用 (502 Bad Gateway)。"
+                        f"请检查PDF解析API服务是否正在运行: {self.pdf_parse_api_url}"
+                    )
                     logger.error(error_msg)
-                raise ValueError(f"{error_msg}. 请检查PDF解析API服务状态。")
-            
-            result = response.json()
+                    raise ConnectionError(error_msg)
+                elif response.status_code != 200:
+                    error_msg = f"PDF解析API返回错误: HTTP {response.status_code}"
+                    try:
+                        await response.aread()
+                        error_body = response.text
+                        logger.error(f"{error_msg}, 响应内容: {error_body[:500]}")
+                    except:
+                        logger.error(error_msg)
+                    raise ValueError(f"{error_msg}. 请检查PDF解析API服务状态。")
+                
+                # 响应体字节直接交给orjson解析，不经过str
+                result = orjson.loads(await response.aread())
             
             logger.debug(f"PDF解析API响应: backend={result.get('backend')}, version={result.get('version')}")
             
@@ -619,7 +921,7 @@ class PdfProcessor:
             else:
                 logger.error(f"PDF解析结果为空，响应内容: {result}")
                 raise ValueError("PDF解析结果为空")
-        except requests.exceptions.ConnectionError as e:
+        except httpx.ConnectError as e:
             elapsed_time = (datetime.now() - start_time).total_seconds()
             error_msg = (
                 f"无法连接到PDF解析API服务: {self.pdf_parse_api_url}。"
@@ -628,7 +930,7 @@ class PdfProcessor:
             )
             logger.error(error_msg)
             raise ConnectionError(error_msg) from e
-        except requests.exceptions.Timeout as e:
+        except httpx.TimeoutException as e:
             elapsed_time = (datetime.now() - start_time).total_seconds()
             error_msg = (
                 f"PDF解析API请求超时（已等待 {elapsed_time:.2f} 秒）。"
@@ -654,65 +956,17 @@ class PdfProcessor:
             output_path: 输出PDF文件路径
         """
         try:
-            import markdown
-            from weasyprint import HTML, CSS
-            from weasyprint.text.fonts import FontConfiguration
+            md, HTML, css, font_config = _get_pdf_renderer()
             
-            # 将Markdown转换为HTML
-            html_content = markdown.markdown(
-                markdown_content,
-                extensions=['extra', 'codehilite', 'tables']
-            )
+            # 将Markdown转换为HTML（复用当前线程的Markdown实例，转换前先reset）
+            html_content = md.reset().convert(markdown_content)
+            html_content = _SCRIPT_RE.sub('', _LINK_RE.sub('', html_content))
             
-            # 添加基本样式以支持中文
-            html_with_style = f"""
+            html_document = f"""
             <!DOCTYPE html>
             <html>
             <head>
                 <meta charset="UTF-8">
-                <style>
-                    @page {{
-                        size: A4;
-                        margin: 2cm;
-                    }}
-                    body {{
-                        font-family: "SimSun", "宋体", "STSong", "Arial", sans-serif;
-                        font-size: 12pt;
-                        line-height: 1.6;
-                        color: #333;
-                    }}
-                    h1, h2, h3, h4, h5, h6 {{
-                        font-family: "SimHei", "黑体", "STHeiti", "Arial", sans-serif;
-                        margin-top: 1em;
-                        margin-bottom: 0.5em;
-                    }}
-                    table {{
-                        border-collapse: collapse;
-                        width: 100%;
-                        margin: 1em 0;
-                    }}
-                    table th, table td {{
-                        border: 1px solid #ddd;
-                        padding: 8px;
-                        text-align: left;
-                    }}
-                    table th {{
-                        background-color: #f2f2f2;
-                        font-weight: bold;
-                    }}
-                    code {{
-                        background-color: #f4f4f4;
-                        padding: 2px 4px;
-                        border-radius: 3px;
-                        font-family: "Courier New", monospace;
-                    }}
-                    pre {{
-                        background-color: #f4f4f4;
-                        padding: 10px;
-                        border-radius: 5px;
-                        overflow-x: auto;
-                    }}
-                </style>
             </head>
             <body>
                 {html_content}
@@ -720,10 +974,10 @@ class PdfProcessor:
             </html>
             """
             
-            # 使用WeasyPrint将HTML转换为PDF
-            font_config = FontConfiguration()
-            HTML(string=html_with_style).write_pdf(
+            # 使用WeasyPrint将HTML转换为PDF，样式表和字体配置均为预先创建的共享对象
+            HTML(string=html_document).write_pdf(
                 output_path,
+                stylesheets=[css],
                 font_config=font_config
             )
             
@@ -755,13 +1009,16 @@ class PdfProcessor:
         """
         logger.info(f"开始处理PDF文档: {filename}, return_pdf={return_pdf}")
         
+        # 本次处理发起的后台调试写入，返回前统一等待
+        debug_tasks = []
+        
         try:
             # 1. 调用PDF解析API，将PDF转换为Markdown
             logger.info("步骤1: 调用PDF解析API")
             markdown_content = await self._parse_pdf_to_markdown(file_content, filename)
             
             # 保存原始Markdown用于调试
-            self._save_debug_info(filename, "01_parsed_markdown", markdown_content, "text")
+            debug_tasks.append(self._spawn_debug(filename, "01_parsed_markdown", markdown_content, "text"))
             
             if not markdown_content.strip():
                 logger.warning("PDF解析结果为空，无法继续处理")
@@ -778,54 +1035,59 @@ class PdfProcessor:
             masked_text = desensitive_result.get('masked', markdown_content)
             entities = desensitive_result.get('entities_found', [])
             
-            # 保存脱敏结果用于调试
-            self._save_debug_info(filename, "02_masked_markdown", masked_text, "text")
-            self._save_debug_info(filename, "03_entities", {
-                'total_entities': len(entities),
-                'entities': entities
-            }, "json")
+            # 保存脱敏结果用于调试（后台写入，与后续的文件输出并行）
+            debug_tasks.append(self._spawn_debug(filename, "02_masked_markdown", masked_text, "text"))
+            if entities:
+                debug_tasks.append(self._spawn_debug(filename, "03_entities", {
+                    'total_entities': len(entities),
+                    'entities': entities
+                }, "json"))
             
             logger.info(f"步骤3: 脱敏完成，识别到 {len(entities)} 个实体")
             
             # 3. 根据return_pdf参数决定返回Markdown还是PDF
+            # PDF渲染和文件写入都是阻塞操作，放到线程池执行，避免占用事件循环
+            loop = asyncio.get_event_loop()
             base_name = os.path.splitext(filename)[0]
             
             if return_pdf:
                 # 将脱敏后的Markdown转换为PDF（用于调试）
                 logger.info("步骤4: 将Markdown转换为PDF")
-                output_path = os.path.join(self.output_dir, f"desensitized_{base_name}.pdf")
+                output_path = str(self._out_dir / f"desensitized_{base_name}.pdf")
                 
-                self._markdown_to_pdf(masked_text, output_path)
+                await loop.run_in_executor(None, self._markdown_to_pdf, masked_text, output_path)
                 
                 logger.info(f"处理成功，输出PDF文件: {output_path}")
                 
                 # 验证输出文件
-                if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                    logger.info(f"文件大小: {os.path.getsize(output_path)} 字节")
+                st = await loop.run_in_executor(None, _stat_or_none, output_path)
+                if st and st.st_size > 0:
+                    logger.info(f"文件大小: {st.st_size} 字节")
                 else:
                     logger.error(f"输出文件验证失败: {output_path}")
             else:
                 # 直接返回Markdown文件
                 logger.info("步骤4: 保存脱敏后的Markdown文件")
-                output_path = os.path.join(self.output_dir, f"desensitized_{base_name}.md")
+                output_path = str(self._out_dir / f"desensitized_{base_name}.md")
                 
-                with open(output_path, 'w', encoding='utf-8') as f:
-                    f.write(masked_text)
+                await loop.run_in_executor(None, _write_text, output_path, masked_text)
                 
                 logger.info(f"处理成功，输出Markdown文件: {output_path}")
                 
                 # 验证输出文件
-                if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                    logger.info(f"文件大小: {os.path.getsize(output_path)} 字节")
+                st = await loop.run_in_executor(None, _stat_or_none, output_path)
+                if st and st.st_size > 0:
+                    logger.info(f"文件大小: {st.st_size} 字节")
                 else:
                     logger.error(f"输出文件验证失败: {output_path}")
             
+            await asyncio.gather(*filter(None, debug_tasks), return_exceptions=True)
             return output_path
             
         except Exception as e:
             logger.error(f"处理PDF文档失败: {e}", exc_info=True)
             # 保存错误信息
-            self._save_debug_info(filename, "99_error", {
+            self._spawn_debug(filename, "99_error", {
                 'error': str(e),
                 'error_type': type(e).__name__
             }, "json")
@@ -845,25 +1107,35 @@ class PdfProcessor:
         Returns:
             脱敏结果字典
         """
+        # 未选择任何实体类型时脱敏服务不会识别任何内容，直接返回原文，不发请求
+        if not schemalist:
+            logger.info("未选择脱敏实体类型，跳过脱敏服务调用")
+            return {'masked': text, 'entities_found': []}
+        
         # 注意：脱敏服务的端口是8888，接口是/mask/custom
         service_url = self.desensitive_service_url.replace(':8001', ':8888')
         endpoint = f"{service_url}/mask/custom"
         
-        payload = {
-            "text": text,
-            "schemalist": schemalist,
-            "max_chunk_len": max_chunk_len
-        }
+        # 相同文本和参数（如重复处理同一PDF）直接返回缓存结果，不再请求脱敏服务
+        cache_key = hashlib.sha256(
+            orjson.dumps([max_chunk_len, schemalist]) + text.encode('utf-8')
+        ).hexdigest()
+        cached = self._mask_cache.get(cache_key)
+        if cached is not None:
+            self._mask_cache.move_to_end(cache_key)
+            logger.info(f"脱敏结果命中缓存，文本长度: {len(text)}")
+            return cached
         
         logger.info(f"调用脱敏服务: {endpoint}, 文本长度: {len(text)}")
         
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(endpoint, json=payload)
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"脱敏服务调用成功，识别到 {len(result.get('entities_found', []))} 个实体")
-                return result
+            result = await _post_desensitive(self._get_client(), endpoint, text, schemalist, max_chunk_len)
+            logger.info(f"脱敏服务调用成功，识别到 {len(result.get('entities_found', []))} 个实体")
+            
+            self._mask_cache[cache_key] = result
+            if len(self._mask_cache) > _MASK_CACHE_SIZE:
+                self._mask_cache.popitem(last=False)
+            return result
         except Exception as e:
             logger.error(f"调用脱敏服务失败: {e}", exc_info=True)
             raise
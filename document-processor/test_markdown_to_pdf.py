@@ -17,9 +17,6 @@ if sys.platform == 'win32':
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
-from service import PdfProcessor
-from common.config import settings
-
 
 def test_markdown_to_pdf(input_file: str, output_file: str = None):
     """
@@ -54,7 +51,10 @@ def test_markdown_to_pdf(input_file: str, output_file: str = None):
     output_dir = os.path.dirname(output_file) or "test_outputs"
     os.makedirs(output_dir, exist_ok=True)
     
-    # 创建PdfProcessor实例
+    # 创建PdfProcessor实例（处理模块在输入检查通过后才导入，出错退出时无需加载）
+    from service import PdfProcessor
+    from common.config import settings
+    
     pdf_processor = PdfProcessor(
         desensitive_service_url=settings.DESENSITIVE_SERVICE_URL,
         pdf_parse_api_url=settings.PDF_PARSE_API_URL
@@ -4,10 +4,12 @@ Gradio前端服务
 """
 import gradio as gr
 import requests
+from requests.adapters import HTTPAdapter
 import re
 import sys
 import os
-import json
+import orjson
+from functools import lru_cache
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -22,20 +24,50 @@ MANDATORY_NUMERIC_SCHEMA = [
 OPTIONAL_SEMANTIC_SCHEMA = ["姓名", "地址", "企业名称", "机构名称", "电子邮箱"]
 SCHEMA = MANDATORY_NUMERIC_SCHEMA + OPTIONAL_SEMANTIC_SCHEMA
 
+# 下载处理结果时每次写入的字节数
+_DOWNLOAD_CHUNK_SIZE = 65536
+
+# 共享的HTTP会话：跨请求复用到后端服务的连接
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=2))
+
 # 服务地址
 DESENSITIVE_BACKEND_URL = settings.DESENSITIVE_SERVICE_URL + "/mask/custom"
 WORD_PROCESSOR_URL = settings.WORD_PROCESSOR_URL + "/api/v1/process/word"
 PDF_PROCESSOR_URL = settings.WORD_PROCESSOR_URL + "/api/v1/process/pdf"
 
+# 自定义脱敏项的分隔符：中英文逗号、顿号或空白
+_LABEL_SPLIT = re.compile(r"[,\s，、]+")
+
+def _dedup_preserve(a, b) -> list:
+    """合并两个序列并去重，保留首次出现的顺序"""
+    return list(dict.fromkeys((*a, *b)))
+
+@lru_cache(maxsize=256)
+def _merge_labels(selected: tuple, custom: str) -> tuple:
+    """合并勾选的标签和自定义标签（自定义项去重后追加在末尾）"""
+    extras = [x.strip() for x in _LABEL_SPLIT.split(custom) if x.strip()]
+    return tuple(_dedup_preserve(selected, extras))
+
+@lru_cache(maxsize=64)
+def _labels_json(labels: tuple) -> str:
+    """标签列表的JSON字符串（作为schemalist表单字段）"""
+    return orjson.dumps(labels).decode()
+
 def _call_mask_custom(text, selected_labels, custom_text, max_chunk_len):
     """调用脱敏服务进行文本脱敏"""
     # 合并勾选的标签和自定义标签
-    labels = list(selected_labels) if selected_labels else []
-    if custom_text:
-        extras = [x.strip() for x in re.split(r"[,\s，、]+", custom_text) if x.strip()]
-        for ex in extras:
-            if ex not in labels:
-                labels.append(ex)
+    labels = list(_merge_labels(tuple(selected_labels or ()), custom_text or ""))
+
+    # 未选择任何实体类型时后端不会识别任何内容，直接返回原文，不发请求
+    if not labels and text and text.strip():
+        return text, {
+            "original": text,
+            "masked": text,
+            "entities_found": [],
+            "mandatory": MANDATORY_NUMERIC_SCHEMA,
+            "optional_selected": [],
+        }
 
     payload = {
         "text": text or "",
@@ -44,7 +76,7 @@ def _call_mask_custom(text, selected_labels, custom_text, max_chunk_len):
     }
 
     try:
-        resp = requests.post(DESENSITIVE_BACKEND_URL, json=payload, timeout=60)
+        resp = _SESSION.post(DESENSITIVE_BACKEND_URL, json=payload, timeout=60)
         resp.raise_for_status()
         data = resp.json()
         return data.get("masked", ""), data
@@ -57,53 +89,50 @@ def _process_word_file(file, selected_labels, custom_text, max_chunk_len):
         return None, "请上传Word文档"
     
     # 合并勾选的标签和自定义标签
-    labels = list(selected_labels) if selected_labels else []
-    if custom_text:
-        extras = [x.strip() for x in re.split(r"[,\s，、]+", custom_text) if x.strip()]
-        for ex in extras:
-            if ex not in labels:
-                labels.append(ex)
+    labels = list(_merge_labels(tuple(selected_labels or ()), custom_text or ""))
     
     try:
-        # 读取文件内容
         # Gradio 3.x 版本，file 是文件对象，可以通过 .name 获取路径
         file_path = file.name if hasattr(file, 'name') else file
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
         
         # 获取文件名
         filename = os.path.basename(file_path) if isinstance(file_path, str) else "document.docx"
         
         # 准备表单数据
-        files = {
-            'file': (filename, file_content, 
-                    'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
-        }
         data = {
             'max_chunk_len': int(max_chunk_len)
         }
         
         # 如果有选择的标签，添加到表单数据
         if labels:
-            data['schemalist'] = json.dumps(labels, ensure_ascii=False)
-        
-        # 调用Word处理服务
-        resp = requests.post(
-            WORD_PROCESSOR_URL,
-            files=files,
-            data=data,
-            timeout=120.0
-        )
-        resp.raise_for_status()
+            data['schemalist'] = _labels_json(tuple(labels))
         
-        # 保存返回的文件
-        output_filename = f"desensitized_{filename}"
-        output_dir = "outputs"
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, output_filename)
+        # 调用Word处理服务：上传文件以文件句柄传入，不先读成bytes；响应流式接收
+        with open(file_path, 'rb') as upload:
+            files = {
+                'file': (filename, upload,
+                        'application/vnd.openxmlformats-officedocument.wordprocessingml.document')
+            }
+            resp = _SESSION.post(
+                WORD_PROCESSOR_URL,
+                files=files,
+                data=data,
+                timeout=120.0,
+                stream=True
+            )
         
-        with open(output_path, 'wb') as f:
-            f.write(resp.content)
+        with resp:
+            resp.raise_for_status()
+            
+            # 保存返回的文件：边接收边写入，不在内存中缓存整个响应体
+            output_filename = f"desensitized_{filename}"
+            output_dir = "outputs"
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, output_filename)
+            
+            with open(output_path, 'wb') as f:
+                for chunk in resp.iter_content(_DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
         
         return output_path, "处理成功！文档已脱敏并保留原格式。"
     except Exception as e:
@@ -115,27 +144,16 @@ def _process_pdf_file(file, selected_labels, custom_text, max_chunk_len):
         return None, "请上传PDF文档"
     
     # 合并勾选的标签和自定义标签
-    labels = list(selected_labels) if selected_labels else []
-    if custom_text:
-        extras = [x.strip() for x in re.split(r"[,\s，、]+", custom_text) if x.strip()]
-        for ex in extras:
-            if ex not in labels:
-                labels.append(ex)
+    labels = list(_merge_labels(tuple(selected_labels or ()), custom_text or ""))
     
     try:
-        # 读取文件内容
         # Gradio 3.x 版本，file 是文件对象，可以通过 .name 获取路径
         file_path = file.name if hasattr(file, 'name') else file
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
         
         # 获取文件名
         filename = os.path.basename(file_path) if isinstance(file_path, str) else "document.pdf"
         
         # 准备表单数据
-        files = {
-            'file': (filename, file_content, 'application/pdf')
-        }
         data = {
             'max_chunk_len': int(max_chunk_len),
             'return_pdf': 'false'  # 默认返回Markdown文件
@@ -143,26 +161,34 @@ def _process_pdf_file(file, selected_labels, custom_text, max_chunk_len):
         
         # 如果有选择的标签，添加到表单数据
         if labels:
-            data['schemalist'] = json.dumps(labels, ensure_ascii=False)
+            data['schemalist'] = _labels_json(tuple(labels))
         
-        # 调用PDF处理服务
-        resp = requests.post(
-            PDF_PROCESSOR_URL,
-            files=files,
-            data=data,
-            timeout=300.0  # PDF处理可能需要更长时间
-        )
-        resp.raise_for_status()
-        
-        # 保存返回的文件（Markdown格式）
-        base_name = os.path.splitext(filename)[0]
-        output_filename = f"desensitized_{base_name}.md"
-        output_dir = "outputs"
-        os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, output_filename)
+        # 调用PDF处理服务：上传文件以文件句柄传入，不先读成bytes；响应流式接收
+        with open(file_path, 'rb') as upload:
+            files = {
+                'file': (filename, upload, 'application/pdf')
+            }
+            resp = _SESSION.post(
+                PDF_PROCESSOR_URL,
+                files=files,
+                data=data,
+                timeout=300.0,  # PDF处理可能需要更长时间
+                stream=True
+            )
         
-        with open(output_path, 'wb') as f:
-            f.write(resp.content)
+        with resp:
+            resp.raise_for_status()
+            
+            # 保存返回的文件（Markdown格式）：边接收边写入
+            base_name = os.path.splitext(filename)[0]
+            output_filename = f"desensitized_{base_name}.md"
+            output_dir = "outputs"
+            os.makedirs(output_dir, exist_ok=True)
+            output_path = os.path.join(output_dir, output_filename)
+            
+            with open(output_path, 'wb') as f:
+                for chunk in resp.iter_content(_DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
         
         return output_path, "处理成功！已生成脱敏后的Markdown文件。"
     except Exception as e: